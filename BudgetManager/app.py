@@ -6,10 +6,12 @@ It uses a database module to interact with the underlying database.
 """
 
 from flask import Flask, render_template, request, redirect, url_for
-from database import Account, Expense, Income
+from database import Account, Expense, Income, Job
 from database import RecordAlreadyExists
+from database import JobRunner, enqueue, reconcileBalances
 
 app = Flask(__name__)
+jobRunner = JobRunner()
 
 
 @app.route('/')
@@ -241,5 +243,34 @@ def deleteIncomeFromDatabaseAndUpdateAccountBalance(incomeId: int) -> str:
     return redirect(url_for('incomes'))
 
 
+@app.route('/jobs', methods=['GET'])
+def jobs() -> str:
+    """Render 'jobs.html' template with background jobs, newest first."""
+    jobsList = sorted(Job.getAll(), key=lambda job: job.id, reverse=True)
+    return render_template('jobs.html', jobs=jobsList)
+
+
+@app.route('/reconciliation', methods=['GET'])
+def reconciliation() -> str:
+    """Check account balances against transactions and render 'reconciliation.html' template."""
+    discrepancies = reconcileBalances()
+    return render_template('reconciliation.html', discrepancies=discrepancies)
+
+
+@app.route('/repairBalances', methods=['GET'])
+def repairBalances() -> str:
+    """Set inconsistent account balances to the expected values. Redirect to 'accounts' route."""
+    reconcileBalances(repair=True)
+    return redirect(url_for('accounts'))
+
+
+@app.route('/reconcileInBackground', methods=['GET'])
+def reconcileInBackground() -> str:
+    """Add balance reconciliation job to the queue. Redirect to 'jobs' route."""
+    enqueue('reconcile_balances')
+    return redirect(url_for('jobs'))
+
+
 if __name__ == '__main__':
+    jobRunner.start()
     app.run(host="0.0.0.0", port=5000)
@@ -1 +1,3 @@
 from .database import *
+from .jobs import *
+from .reconciliation import *
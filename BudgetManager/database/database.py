@@ -2,9 +2,11 @@
 
 from pydoc import classname
 from sqlalchemy import create_engine
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, func
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+import json
 import os
 
 class RecordNotFound(Exception):
@@ -114,6 +116,9 @@ class Account(Base):
         self.name = name
         self.balance = balance
         self.addToDatabase()
+        with dbConnection() as session:
+            accountId = session.query(Account.id).filter(Account.name == name).scalar()
+        BalanceCheckpoint.start(accountId, float(balance))
 
     def edit(self, name: str, balance: float) -> None:
         """Update object data and record in the database.
@@ -124,15 +129,46 @@ class Account(Base):
         """
         with dbConnection() as session:
             try:
+                balanceChanged = float(balance) != float(self.balance)
                 session.query(Account).filter(Account.id == self.id).update(
                     {'name': name, 'balance': balance})
                 session.commit()
                 self.name = name
                 self.balance = balance
+                if balanceChanged:
+                    BalanceCheckpoint.start(self.id, float(balance) - Account.getTransactionsTotal(self.id))
             except IntegrityError:
                 session.rollback()
                 raise RecordAlreadyExists
 
+    @staticmethod
+    def getTransactionsTotal(accountId: int) -> float:
+        """Get sum of incomes minus sum of expenses of the account.
+
+        Args:
+            accountId (int): ID of the account.
+
+        Returns:
+            float: Balance change made by all account transactions.
+        """
+        with dbConnection() as session:
+            incomes = session.query(func.coalesce(func.sum(Income.amount), 0.0)).filter(
+                Income.accountId == accountId).scalar()
+            expenses = session.query(func.coalesce(func.sum(Expense.amount), 0.0)).filter(
+                Expense.accountId == accountId).scalar()
+            return incomes - expenses
+
+    def deleteFromDatabase(self) -> None:
+        """Delete account and its balance checkpoint from the database."""
+        BalanceCheckpoint.reset(self.id)
+        super().deleteFromDatabase()
+
+    @classmethod
+    def deleteAllFromDatabase(cls) -> None:
+        """Delete all accounts and balance checkpoints from the database."""
+        BalanceCheckpoint.deleteAllFromDatabase()
+        super().deleteAllFromDatabase()
+
     @staticmethod
     def updateBalance(accountId, balanceChange: float):
         """This method upadate the balance ONLY in the database. After using this method
@@ -155,7 +191,8 @@ class Account(Base):
 
     @staticmethod
     def transferMoney(sourceId: int, destinationId: int, amount: float) -> None:
-        """Transfer money between accounts.
+        """Transfer money between accounts. Transfers are not stored as transactions,
+        so they are added to the reconciliation baseline of both accounts.
 
         Args:
             sourceId (int): ID of account to transfer money from.
@@ -166,6 +203,8 @@ class Account(Base):
             Account.updateBalance(sourceId, -amount)
             Account.updateBalance(destinationId, amount)
             session.commit()
+        BalanceCheckpoint.adjustBaseline(sourceId, -amount)
+        BalanceCheckpoint.adjustBaseline(destinationId, amount)
 
 
 class Expense(Base):
@@ -203,6 +242,8 @@ class Expense(Base):
             accountId (int): New account ID of the expense.
             date (str): New date of the expense.
         """
+        BalanceCheckpoint.rescan(self.accountId)
+        BalanceCheckpoint.rescan(accountId)
         with dbConnection() as session:
             session.query(Expense).filter(Expense.id == self.id).update(
                 {'name': name, 'amount': amount, 'date': date, 'accountId': accountId})
@@ -212,6 +253,19 @@ class Expense(Base):
             self.accountId = accountId
             self.date = date
 
+    def deleteFromDatabase(self) -> None:
+        """Delete expense from the database without changing account balance.
+        Account is rescanned at the next balance reconciliation."""
+        super().deleteFromDatabase()
+        BalanceCheckpoint.rescan(self.accountId)
+
+    @classmethod
+    def deleteAllFromDatabase(cls) -> None:
+        """Delete all expenses from the database without changing account balances.
+        All accounts are rescanned at the next balance reconciliation."""
+        super().deleteAllFromDatabase()
+        BalanceCheckpoint.rescanAll()
+
 
 class Income(Base):
     """Represents an expense table in the database."""
@@ -248,6 +302,8 @@ class Income(Base):
             accountId (int): New account ID of the expense.
             date (str): New date of the expense.
         """
+        BalanceCheckpoint.rescan(self.accountId)
+        BalanceCheckpoint.rescan(accountId)
         with dbConnection() as session:
             session.query(Income).filter(Income.id == self.id).update(
                 {'name': name, 'amount': amount, 'date': date, 'accountId': accountId})
@@ -256,3 +312,210 @@ class Income(Base):
             self.amount = amount
             self.accountId = accountId
             self.date = date
+
+    def deleteFromDatabase(self) -> None:
+        """Delete income from the database without changing account balance.
+        Account is rescanned at the next balance reconciliation."""
+        super().deleteFromDatabase()
+        BalanceCheckpoint.rescan(self.accountId)
+
+    @classmethod
+    def deleteAllFromDatabase(cls) -> None:
+        """Delete all incomes from the database without changing account balances.
+        All accounts are rescanned at the next balance reconciliation."""
+        super().deleteAllFromDatabase()
+        BalanceCheckpoint.rescanAll()
+
+
+class BalanceCheckpoint(Base):
+    """Represents a balance reconciliation checkpoint of an account.
+    Expected balance of the account is baseline + transactionsTotal + sum of incomes
+    and expenses added after lastIncomeId and lastExpenseId.
+    """
+    __tablename__ = 'balance_checkpoints'
+    accountId = Column(Integer, ForeignKey('accounts.id'), nullable=False, unique=True)
+    baseline = Column(Float, nullable=False)
+    transactionsTotal = Column(Float, nullable=False, default=0.0)
+    lastIncomeId = Column(Integer, nullable=False, default=0)
+    lastExpenseId = Column(Integer, nullable=False, default=0)
+    checkedAt = Column(String, nullable=False)
+
+    @staticmethod
+    def start(accountId: int, baseline: float) -> None:
+        """Create checkpoint of the account, so its balance is tracked from now on.
+        Existing checkpoint is replaced and the account is rescanned at the next reconciliation.
+
+        Args:
+            accountId (int): ID of the account.
+            baseline (float): Balance of the account without any transactions.
+        """
+        with dbConnection() as session:
+            session.query(BalanceCheckpoint).filter(
+                BalanceCheckpoint.accountId == accountId).delete()
+            session.add(BalanceCheckpoint(accountId=accountId, baseline=baseline, transactionsTotal=0.0,
+                                          lastIncomeId=0, lastExpenseId=0,
+                                          checkedAt=datetime.now().isoformat(timespec='seconds')))
+            session.commit()
+
+    @staticmethod
+    def reset(accountId: int) -> None:
+        """Delete checkpoint of the account. Next reconciliation takes the current
+        balance as correct. Use it when the account is deleted.
+
+        Args:
+            accountId (int): ID of the account.
+        """
+        with dbConnection() as session:
+            session.query(BalanceCheckpoint).filter(
+                BalanceCheckpoint.accountId == accountId).delete()
+            session.commit()
+
+    @staticmethod
+    def rescan(accountId: int) -> None:
+        """Keep the baseline, but make next reconciliation sum all account transactions again.
+        Use it when already checked transaction is edited or deleted.
+
+        Args:
+            accountId (int): ID of the account.
+        """
+        with dbConnection() as session:
+            session.query(BalanceCheckpoint).filter(BalanceCheckpoint.accountId == accountId).update(
+                {'transactionsTotal': 0.0, 'lastIncomeId': 0, 'lastExpenseId': 0})
+            session.commit()
+
+    @staticmethod
+    def rescanAll() -> None:
+        """Make next reconciliation sum all transactions of every account again."""
+        with dbConnection() as session:
+            session.query(BalanceCheckpoint).update(
+                {'transactionsTotal': 0.0, 'lastIncomeId': 0, 'lastExpenseId': 0})
+            session.commit()
+
+    @staticmethod
+    def adjustBaseline(accountId: int, balanceChange: float) -> None:
+        """Add balance change, which is not stored as a transaction, to the baseline.
+
+        Args:
+            accountId (int): ID of the account.
+            balanceChange (float): Amount of money added to or subtracted from the account.
+        """
+        with dbConnection() as session:
+            session.query(BalanceCheckpoint).filter(BalanceCheckpoint.accountId == accountId).update(
+                {'baseline': BalanceCheckpoint.baseline + balanceChange})
+            session.commit()
+
+
+class Job(Base):
+    """Represents a background job table in the database.
+    Jobs are executed outside the request thread by JobRunner from the jobs module.
+    """
+    __tablename__ = 'jobs'
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    name = Column(String, nullable=False)
+    payload = Column(String, nullable=False, default='{}')
+    status = Column(String, nullable=False, default=PENDING)
+    progress = Column(Float, nullable=False, default=0.0)
+    attempts = Column(Integer, nullable=False, default=0)
+    maxAttempts = Column(Integer, nullable=False, default=3)
+    result = Column(String)
+    error = Column(String)
+    createdAt = Column(String, nullable=False)
+    updatedAt = Column(String, nullable=False)
+    runAfter = Column(String, nullable=False)
+
+    def __init__(self, name: str, payload: dict = None, maxAttempts: int = 3, id: int = None) -> None:
+        """Class constructor. Adds the job to the database as pending.
+
+        Args:
+            name (str): Name of the registered job handler.
+            payload (dict, optional): JSON serializable arguments for the handler. Defaults to None.
+            maxAttempts (int, optional): How many times the job is run before it is marked as failed. Defaults to 3.
+            id (int, optional): Job ID. Defaults to None. Database will assign it automatically.
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        self.id = id
+        self.name = name
+        self.payload = json.dumps(payload or {})
+        self.status = Job.PENDING
+        self.progress = 0.0
+        self.attempts = 0
+        self.maxAttempts = maxAttempts
+        self.createdAt = now
+        self.updatedAt = now
+        self.runAfter = now
+        self.addToDatabase()
+
+    def addToDatabase(self) -> None:
+        """Add job to the database and load its generated fields,
+        so the ID is available after the session is gone."""
+        with dbConnection() as session:
+            session.add(self)
+            session.commit()
+            session.refresh(self)
+            session.expunge(self)
+
+    def getPayload(self) -> dict:
+        """Return decoded job payload."""
+        return json.loads(self.payload)
+
+    @staticmethod
+    def getPendingIds() -> list:
+        """Get IDs of pending jobs which are due to run, oldest first.
+
+        Returns:
+            list: IDs of pending jobs.
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        with dbConnection() as session:
+            rows = session.query(Job.id).filter(
+                Job.status == Job.PENDING, Job.runAfter <= now).order_by(Job.id).all()
+            return [row.id for row in rows]
+
+    @staticmethod
+    def claim(jobId: int) -> bool:
+        """Mark pending job as running and count the attempt. The update is conditional,
+        so only one worker can claim the same job.
+
+        Args:
+            jobId (int): ID of the job to claim.
+
+        Returns:
+            bool: True if the job was claimed by the caller.
+        """
+        with dbConnection() as session:
+            claimed = session.query(Job).filter(Job.id == jobId, Job.status == Job.PENDING).update(
+                {'status': Job.RUNNING, 'attempts': Job.attempts + 1,
+                 'updatedAt': datetime.now().isoformat(timespec='seconds')})
+            session.commit()
+            return claimed == 1
+
+    @staticmethod
+    def recoverRunning() -> None:
+        """Return jobs left running by a stopped process to the queue.
+        Jobs without attempts left are marked as failed."""
+        now = datetime.now().isoformat(timespec='seconds')
+        with dbConnection() as session:
+            running = session.query(Job).filter(Job.status == Job.RUNNING)
+            running.filter(Job.attempts >= Job.maxAttempts).update(
+                {'status': Job.FAILED, 'error': 'Interrupted', 'updatedAt': now})
+            running.filter(Job.attempts < Job.maxAttempts).update(
+                {'status': Job.PENDING, 'updatedAt': now})
+            session.commit()
+
+    @staticmethod
+    def updateStatus(jobId: int, **fields) -> None:
+        """This method updates the job ONLY in the database. After using this method
+        you have to import the object again to get the updated data.
+
+        Args:
+            jobId (int): ID of the job to update.
+            **fields: Column values to set, e.g. status, progress, result, error.
+        """
+        fields['updatedAt'] = datetime.now().isoformat(timespec='seconds')
+        with dbConnection() as session:
+            session.query(Job).filter(Job.id == jobId).update(fields)
+            session.commit()
@@ -0,0 +1,180 @@
+"""Contains in-process background job queue backed by the jobs table."""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import logging
+import threading
+import time
+from .database import Job
+
+__all__ = ['UnknownJob', 'jobHandler', 'enqueue', 'JobRunner']
+
+_handlers = {}
+_logger = logging.getLogger(__name__)
+
+
+class UnknownJob(Exception):
+    """Raised when a job is enqueued for a handler that is not registered."""
+    pass
+
+
+def jobHandler(name: str):
+    """Decorator registering a function as a handler for jobs with the given name.
+    Handler is called with the job payload (dict) and a progress callback
+    accepting a value from 0 to 1. Its return value is stored as JSON in the job result.
+
+    Args:
+        name (str): Name of the job.
+    """
+    def register(function):
+        _handlers[name] = function
+        return function
+    return register
+
+
+def enqueue(name: str, payload: dict = None, maxAttempts: int = 3) -> Job:
+    """Add job to the queue. It will be executed by a running JobRunner.
+
+    Args:
+        name (str): Name of the registered job handler.
+        payload (dict, optional): JSON serializable arguments for the handler. Defaults to None.
+        maxAttempts (int, optional): How many times the job is run before it is marked as failed. Defaults to 3.
+
+    Raises:
+        UnknownJob: If there is no handler registered for the name.
+
+    Returns:
+        Job: Created job.
+    """
+    if name not in _handlers:
+        raise UnknownJob(name)
+    return Job(name, payload, maxAttempts)
+
+
+class JobRunner:
+    """Executes pending jobs on a thread pool. Polling thread looks for pending
+    jobs in the database, so jobs enqueued from any request are picked up."""
+
+    def __init__(self, workers: int = 2, pollInterval: float = 1.0, retryDelay: float = 5.0) -> None:
+        """Class constructor.
+
+        Args:
+            workers (int, optional): Number of worker threads. Defaults to 2.
+            pollInterval (float, optional): Seconds between checks for new jobs. Defaults to 1.0.
+            retryDelay (float, optional): Seconds before the first retry of a failed job.
+            It doubles with every next attempt. Defaults to 5.0.
+        """
+        self.workers = workers
+        self.pollInterval = pollInterval
+        self.retryDelay = retryDelay
+        self._executor = None
+        self._thread = None
+        self._stopEvent = threading.Event()
+        self._submitted = set()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start worker threads and the polling thread. Jobs interrupted
+        by a previous process are returned to the queue first."""
+        if self._thread is not None:
+            return
+        Job.recoverRunning()
+        self._stopEvent.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling and wait for running jobs to finish."""
+        if self._thread is None:
+            return
+        self._stopEvent.set()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        self._thread = None
+        self._executor = None
+
+    def runPending(self) -> int:
+        """Run all currently pending jobs in the calling thread.
+
+        Returns:
+            int: Number of jobs executed.
+        """
+        executed = 0
+        for jobId in Job.getPendingIds():
+            if self.runJob(jobId):
+                executed += 1
+        return executed
+
+    def runJob(self, jobId: int) -> bool:
+        """Claim and execute a single job. If the handler raises an exception, the job
+        goes back to the queue with a growing delay until it runs out of attempts,
+        then it is marked as failed.
+
+        Args:
+            jobId (int): ID of the job to run.
+
+        Returns:
+            bool: True if the job was claimed and executed.
+        """
+        if not Job.claim(jobId):
+            return False
+        job = None
+        handler = None
+        try:
+            job = Job.importFromDatabase(jobId)
+            handler = _handlers.get(job.name)
+            if handler is None:
+                raise UnknownJob(job.name)
+            result = handler(job.getPayload(), lambda value: Job.updateStatus(
+                jobId, progress=min(max(float(value), 0.0), 1.0)))
+            result = json.dumps(result)
+        except Exception as exception:
+            # Job could not be loaded, e.g. database was locked, so it is retried without counting attempts
+            attempts = job.attempts if job is not None else 1
+            retry = job is None or (handler is not None and attempts < job.maxAttempts)
+            status = Job.PENDING if retry else Job.FAILED
+            delay = timedelta(seconds=self.retryDelay * 2 ** (attempts - 1))
+            runAfter = (datetime.now() + delay).isoformat(timespec='seconds')
+            self._writeStatus(jobId, status=status, error=repr(exception), runAfter=runAfter)
+        else:
+            self._writeStatus(jobId, status=Job.DONE, progress=1.0, result=result, error=None)
+        return True
+
+    def _writeStatus(self, jobId: int, tries: int = 5, **fields) -> None:
+        """Save status of a finished run. Writing is repeated when it fails, so the job
+        doesn't stay running. If every try fails, the job is recovered at the next start."""
+        for attempt in range(tries):
+            try:
+                Job.updateStatus(jobId, **fields)
+                return
+            except Exception:
+                _logger.exception('Saving status of job %s failed', jobId)
+                time.sleep(0.1 * 2 ** attempt)
+
+    def _poll(self) -> None:
+        """Submit pending jobs to the executor until the runner is stopped."""
+        while not self._stopEvent.is_set():
+            try:
+                pendingIds = Job.getPendingIds()
+            except Exception:
+                _logger.exception('Checking for pending jobs failed')
+                pendingIds = []
+            for jobId in pendingIds:
+                with self._lock:
+                    if jobId in self._submitted:
+                        continue
+                    self._submitted.add(jobId)
+                self._executor.submit(self._runSubmitted, jobId)
+            self._stopEvent.wait(self.pollInterval)
+
+    def _runSubmitted(self, jobId: int) -> None:
+        """Run job submitted by the polling thread and allow it to be submitted again."""
+        try:
+            self.runJob(jobId)
+        except Exception:
+            _logger.exception('Running job %s failed', jobId)
+        finally:
+            with self._lock:
+                self._submitted.discard(jobId)
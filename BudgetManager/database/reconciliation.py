@@ -0,0 +1,112 @@
+"""Contains balance reconciliation, which compares stored account balances with transaction history."""
+
+from datetime import datetime
+from sqlalchemy import select, update, func, literal, union_all
+from .database import dbConnection, Account, Expense, Income, BalanceCheckpoint
+from .jobs import jobHandler
+
+__all__ = ['reconcileBalances']
+
+TOLERANCE = 0.005
+PROGRESS_BATCH = 100
+
+
+def _transactionTotals():
+    """Build grouped query summing incomes and expenses added after each account checkpoint.
+    Accounts without checkpoint have all transactions summed. Rows are also bounded by the lowest
+    checkpoint, so SQLite seeks on the primary key instead of scanning whole tables.
+
+    Returns:
+        Subquery: Columns accountId, total, lastIncomeId and lastExpenseId.
+    """
+    incomeBound = select(func.min(func.coalesce(BalanceCheckpoint.lastIncomeId, 0))).select_from(
+        Account).outerjoin(BalanceCheckpoint, BalanceCheckpoint.accountId == Account.id).scalar_subquery()
+    expenseBound = select(func.min(func.coalesce(BalanceCheckpoint.lastExpenseId, 0))).select_from(
+        Account).outerjoin(BalanceCheckpoint, BalanceCheckpoint.accountId == Account.id).scalar_subquery()
+    incomes = select(
+        Income.accountId.label('accountId'),
+        Income.amount.label('amount'),
+        Income.id.label('incomeId'),
+        literal(0).label('expenseId'),
+    ).outerjoin(BalanceCheckpoint, BalanceCheckpoint.accountId == Income.accountId).where(
+        Income.id > func.coalesce(incomeBound, 0),
+        Income.id > func.coalesce(BalanceCheckpoint.lastIncomeId, 0))
+    expenses = select(
+        Expense.accountId.label('accountId'),
+        (-Expense.amount).label('amount'),
+        literal(0).label('incomeId'),
+        Expense.id.label('expenseId'),
+    ).outerjoin(BalanceCheckpoint, BalanceCheckpoint.accountId == Expense.accountId).where(
+        Expense.id > func.coalesce(expenseBound, 0),
+        Expense.id > func.coalesce(BalanceCheckpoint.lastExpenseId, 0))
+    transactions = union_all(incomes, expenses).subquery()
+    return select(
+        transactions.c.accountId,
+        func.sum(transactions.c.amount).label('total'),
+        func.max(transactions.c.incomeId).label('lastIncomeId'),
+        func.max(transactions.c.expenseId).label('lastExpenseId'),
+    ).group_by(transactions.c.accountId).subquery()
+
+
+def reconcileBalances(repair: bool = False, progress=None) -> list:
+    """Compare balance of every account with its expected balance and move checkpoints forward,
+    so the next call only sums transactions added in the meantime. Balances and transaction totals
+    are read with one statement, so both come from the same database snapshot.
+    Accounts get a checkpoint when they are created. Account without checkpoint (created before
+    reconciliation existed) has its current balance taken as correct.
+
+    Args:
+        repair (bool, optional): Set balances of inconsistent accounts to the expected value.
+        Everything is saved in one transaction. Defaults to False.
+        progress (callable, optional): Called with a value from 0 to 1 after the aggregate query
+        and after every batch of checked accounts. Defaults to None.
+
+    Returns:
+        list: Dictionaries with accountId, name, balance, expected and difference
+        for every account with inconsistent balance.
+    """
+    checkedAt = datetime.now().isoformat(timespec='seconds')
+    discrepancies = []
+    repairs = []
+    with dbConnection() as session:
+        totals = _transactionTotals()
+        rows = session.execute(
+            select(Account, BalanceCheckpoint, totals.c.total, totals.c.lastIncomeId, totals.c.lastExpenseId)
+            .outerjoin(BalanceCheckpoint, BalanceCheckpoint.accountId == Account.id)
+            .outerjoin(totals, totals.c.accountId == Account.id)).all()
+        if progress:
+            progress(0.5)
+        for checked, (account, checkpoint, total, lastIncomeId, lastExpenseId) in enumerate(rows, 1):
+            if progress and checked % PROGRESS_BATCH == 0:
+                progress(0.5 + 0.5 * checked / len(rows))
+            total = total or 0.0
+            if checkpoint is None:
+                checkpoint = BalanceCheckpoint(accountId=account.id, baseline=account.balance - total,
+                                               transactionsTotal=0.0, lastIncomeId=0, lastExpenseId=0)
+                session.add(checkpoint)
+            checkpoint.transactionsTotal += total
+            checkpoint.lastIncomeId = max(checkpoint.lastIncomeId, lastIncomeId or 0)
+            checkpoint.lastExpenseId = max(checkpoint.lastExpenseId, lastExpenseId or 0)
+            checkpoint.checkedAt = checkedAt
+            expected = round(checkpoint.baseline + checkpoint.transactionsTotal, 2)
+            difference = round(account.balance - expected, 2)
+            if abs(difference) < TOLERANCE:
+                continue
+            discrepancies.append({'accountId': account.id, 'name': account.name,
+                                  'balance': account.balance, 'expected': expected,
+                                  'difference': difference})
+            repairs.append((account.id, difference))
+        # Writes start after the loop, so progress updates of a running job don't wait for a database lock
+        if repair:
+            for accountId, difference in repairs:
+                # Relative update keeps balance changes committed since the accounts were read
+                session.execute(update(Account).where(Account.id == accountId).values(
+                    balance=Account.balance - difference))
+        session.commit()
+    return discrepancies
+
+
+@jobHandler('reconcile_balances')
+def reconcileBalancesJob(payload: dict, progress) -> list:
+    """Run balance reconciliation as a background job."""
+    return reconcileBalances(payload.get('repair', False), progress)
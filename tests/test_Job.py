@@ -0,0 +1,168 @@
+import json
+import time
+import pytest
+from BudgetManager.database import Job, JobRunner, UnknownJob
+from BudgetManager.database import enqueue, jobHandler
+
+calls = []
+
+
+@jobHandler('test_sum')
+def sumJob(payload: dict, progress) -> int:
+    """Sum payload values and report progress."""
+    calls.append(payload)
+    progress(0.5)
+    return sum(payload['values'])
+
+
+@jobHandler('test_failing')
+def failingJob(payload: dict, progress) -> None:
+    """Always raise an exception."""
+    raise ValueError('Job failed')
+
+
+@jobHandler('test_not_serializable')
+def notSerializableJob(payload: dict, progress) -> set:
+    """Return result which can't be stored as JSON."""
+    return {1, 2}
+
+
+@pytest.fixture
+def setup():
+    """Clear jobs table and recorded handler calls."""
+    Job.deleteAllFromDatabase()
+    calls.clear()
+    yield
+    Job.deleteAllFromDatabase()
+
+
+def test_enqueue(setup):
+    """Test adding jobs to the queue for registered and unregistered handlers."""
+    job = enqueue('test_sum', {'values': [1, 2]})
+    job = Job.importFromDatabase(job.id)
+    assert job.status == Job.PENDING
+    assert job.getPayload() == {'values': [1, 2]}
+    with pytest.raises(UnknownJob):
+        enqueue('not_registered')
+
+
+def test_runPending(setup):
+    """Test executing pending job and storing its result."""
+    job = enqueue('test_sum', {'values': [1, 2, 3]})
+    assert JobRunner().runPending() == 1
+    job = Job.importFromDatabase(job.id)
+    assert job.status == Job.DONE
+    assert job.progress == 1.0
+    assert job.attempts == 1
+    assert json.loads(job.result) == 6
+    assert JobRunner().runPending() == 0
+
+
+def test_claim(setup):
+    """Test that a job can be claimed only once."""
+    job = enqueue('test_sum', {'values': []})
+    assert Job.claim(job.id)
+    assert not Job.claim(job.id)
+    assert JobRunner().runPending() == 0
+
+
+def test_retries(setup):
+    """Test that failing job is retried until it runs out of attempts."""
+    job = enqueue('test_failing', maxAttempts=2)
+    runner = JobRunner(retryDelay=0)
+    runner.runPending()
+    job = Job.importFromDatabase(job.id)
+    assert job.status == Job.PENDING
+    assert 'Job failed' in job.error
+    runner.runPending()
+    job = Job.importFromDatabase(job.id)
+    assert job.status == Job.FAILED
+    assert job.attempts == 2
+    assert runner.runPending() == 0
+
+
+def test_startAndStop(setup):
+    """Test that started runner executes jobs in background threads."""
+    job = enqueue('test_sum', {'values': [5]})
+    runner = JobRunner(workers=1, pollInterval=0.05)
+    runner.start()
+    for _ in range(100):
+        if Job.importFromDatabase(job.id).status == Job.DONE:
+            break
+        time.sleep(0.05)
+    runner.stop()
+    assert Job.importFromDatabase(job.id).status == Job.DONE
+    assert calls == [{'values': [5]}]
+
+
+def test_notSerializableResult(setup):
+    """Test that result which can't be stored as JSON fails the job instead of leaving it running."""
+    job = enqueue('test_not_serializable', maxAttempts=1)
+    assert JobRunner().runPending() == 1
+    job = Job.importFromDatabase(job.id)
+    assert job.status == Job.FAILED
+    assert 'TypeError' in job.error
+
+
+def test_recoverRunning(setup):
+    """Test that jobs left running by a stopped process are queued again or failed."""
+    retried = enqueue('test_sum', {'values': [1]})
+    interrupted = enqueue('test_sum', {'values': [2]}, maxAttempts=1)
+    assert Job.claim(retried.id)
+    assert Job.claim(interrupted.id)
+    Job.recoverRunning()
+    assert Job.importFromDatabase(retried.id).status == Job.PENDING
+    assert Job.importFromDatabase(interrupted.id).status == Job.FAILED
+    assert JobRunner().runPending() == 1
+
+
+def test_retryDelay(setup):
+    """Test that failed job is not retried before its delay passes."""
+    job = enqueue('test_failing', maxAttempts=2)
+    runner = JobRunner(retryDelay=60)
+    assert runner.runPending() == 1
+    assert Job.importFromDatabase(job.id).status == Job.PENDING
+    assert Job.getPendingIds() == []
+    assert runner.runPending() == 0
+
+
+def test_statusWriteFailure(setup, monkeypatch):
+    """Test that failing database write of the result is repeated instead of leaving job running."""
+    job = enqueue('test_sum', {'values': [1]})
+    updateStatus = Job.updateStatus
+    failures = []
+
+    def flakyUpdateStatus(jobId, **fields):
+        if fields.get('status') == Job.DONE and not failures:
+            failures.append(jobId)
+            raise RuntimeError('database is locked')
+        updateStatus(jobId, **fields)
+
+    monkeypatch.setattr(Job, 'updateStatus', staticmethod(flakyUpdateStatus))
+    assert JobRunner().runPending() == 1
+    assert failures == [job.id]
+    assert Job.importFromDatabase(job.id).status == Job.DONE
+
+
+def test_pollSurvivesDatabaseError(setup, monkeypatch):
+    """Test that polling thread keeps running after a database error."""
+    getPendingIds = Job.getPendingIds
+    failures = []
+
+    def flakyGetPendingIds():
+        if not failures:
+            failures.append(True)
+            raise RuntimeError('database is locked')
+        return getPendingIds()
+
+    monkeypatch.setattr(Job, 'getPendingIds', staticmethod(flakyGetPendingIds))
+    job = enqueue('test_sum', {'values': [3]})
+    runner = JobRunner(workers=1, pollInterval=0.05)
+    runner.start()
+    for _ in range(100):
+        if Job.importFromDatabase(job.id).status == Job.DONE:
+            break
+        time.sleep(0.05)
+    runner.stop()
+    assert failures == [True]
+    assert Job.importFromDatabase(job.id).status == Job.DONE
@@ -0,0 +1,146 @@
+import pytest
+from BudgetManager.database import Account, Expense, Income, BalanceCheckpoint
+from BudgetManager.database import reconcileBalances
+
+
+@pytest.fixture
+def setup():
+    """Create testing data and first checkpoint."""
+    Expense.deleteAllFromDatabase()
+    Income.deleteAllFromDatabase()
+    Account.deleteAllFromDatabase()
+    Account('Test Account', 1000, 1)
+    Account('Test Account 2', 2000, 2)
+    Expense('Test Expense', 100, 1, '2021-01-01', 1)
+    Account.updateBalance(1, -100)
+    Income('Test Income', 300, 2, '2021-01-02', 1)
+    Account.updateBalance(2, 300)
+    yield
+    Expense.deleteAllFromDatabase()
+    Income.deleteAllFromDatabase()
+    Account.deleteAllFromDatabase()
+
+
+def test_consistentBalances(setup):
+    """Test that balances updated together with transactions are consistent."""
+    assert reconcileBalances() == []
+    Expense('Test Expense 2', 50, 2, '2021-01-03', 2)
+    Account.updateBalance(2, -50)
+    Account.transferMoney(1, 2, 200)
+    assert reconcileBalances() == []
+
+
+def test_deletedExpense(setup):
+    """Test that deleting expense without undoing it is reported."""
+    reconcileBalances()
+    Expense.importFromDatabase(1).deleteFromDatabase()
+    discrepancies = reconcileBalances()
+    assert len(discrepancies) == 1
+    assert discrepancies[0]['accountId'] == 1
+    assert discrepancies[0]['balance'] == 900
+    assert discrepancies[0]['expected'] == 1000
+    assert discrepancies[0]['difference'] == -100
+    # Reconciliation without repair doesn't change the balance
+    assert Account.importFromDatabase(1).balance == 900
+    assert len(reconcileBalances()) == 1
+
+
+def test_repair(setup):
+    """Test that repair sets balance to the expected value."""
+    reconcileBalances()
+    Income.importFromDatabase(1).deleteFromDatabase()
+    assert len(reconcileBalances(repair=True)) == 1
+    assert Account.importFromDatabase(2).balance == 2000
+    assert reconcileBalances() == []
+
+
+def test_incrementalCheckpoint(setup):
+    """Test that checkpoint moves forward and counts only new transactions."""
+    reconcileBalances()
+    Income('Test Income 2', 25, 1, '2021-01-04', 2)
+    Account.updateBalance(1, 25)
+    assert reconcileBalances() == []
+    checkpoint = BalanceCheckpoint.getAll()
+    checkpoint = [c for c in checkpoint if c.accountId == 1][0]
+    assert checkpoint.lastExpenseId == 1
+    assert checkpoint.lastIncomeId == 2
+    assert checkpoint.baseline + checkpoint.transactionsTotal == 925
+    Income('Test Income 3', 10, 1, '2021-01-05', 3)
+    discrepancies = reconcileBalances()
+    assert discrepancies[0]['expected'] == 935
+
+
+def test_editAccountResetsCheckpoint(setup):
+    """Test that balance set explicitly is taken as correct."""
+    reconcileBalances()
+    account = Account.importFromDatabase(1)
+    account.edit('Test Account', 5000)
+    assert reconcileBalances() == []
+
+
+def test_renameAccountKeepsCheckpoint(setup):
+    """Test that editing only the name doesn't accept found discrepancy."""
+    reconcileBalances()
+    Expense.importFromDatabase(1).deleteFromDatabase()
+    account = Account.importFromDatabase(1)
+    account.edit('Renamed Account', account.balance)
+    assert len(reconcileBalances()) == 1
+
+
+def test_driftBeforeFirstCheck(setup):
+    """Test that new account is tracked from creation, before the first reconciliation."""
+    Account('Test Account 3', 500, 3)
+    Expense('Test Expense 3', 40, 3, '2021-01-06', 3)
+    Account.updateBalance(3, -40)
+    Expense.importFromDatabase(3).deleteFromDatabase()
+    discrepancies = reconcileBalances()
+    assert len(discrepancies) == 1
+    assert discrepancies[0]['accountId'] == 3
+    assert discrepancies[0]['expected'] == 500
+
+
+def test_progress(setup):
+    """Test that progress is reported after the aggregate query."""
+    reported = []
+    reconcileBalances(progress=reported.append)
+    assert reported == [0.5]
+
+
+def test_expenseAddedDuringCheck(setup):
+    """Test that transaction committed while reconciliation runs doesn't cause false repair."""
+    reconcileBalances()
+
+    def addExpense(value):
+        if not Expense.getAll()[1:]:
+            Expense('Test Expense 2', 100, 1, '2021-01-07', 2)
+            Account.updateBalance(1, -100)
+
+    assert reconcileBalances(repair=True, progress=addExpense) == []
+    assert Account.importFromDatabase(1).balance == 800
+    assert reconcileBalances() == []
+
+
+def test_driftAfterBalanceEdit(setup):
+    """Test that account stays tracked after its balance is edited."""
+    reconcileBalances()
+    Account.importFromDatabase(1).edit('Test Account', 5000)
+    Expense('Test Expense 2', 30, 1, '2021-01-08', 2)
+    Account.updateBalance(1, -30)
+    Expense.importFromDatabase(2).deleteFromDatabase()
+    discrepancies = reconcileBalances()
+    assert len(discrepancies) == 1
+    assert discrepancies[0]['expected'] == 5000
+
+
+def test_deleteAllExpenses(setup):
+    """Test that expenses added after deleting all expenses are not skipped."""
+    reconcileBalances()
+    Expense.deleteAllFromDatabase()
+    Expense('Test Expense 2', 30, 1, '2021-01-09')
+    Account.updateBalance(1, -30)
+    # SQLite reuses the ID of deleted expense
+    assert Expense.getAll()[0].id == 1
+    discrepancies = reconcileBalances()
+    assert len(discrepancies) == 1
+    assert discrepancies[0]['expected'] == 970
+    assert discrepancies[0]['difference'] == -100